@@ -30,6 +30,7 @@ lambda_stack = LambdaStack(
     "DrugVerificationLambdaStack",
     image_bucket=s3_stack.image_bucket,
     verification_table=dynamodb_stack.verification_table,
+    ocr_cache_table=dynamodb_stack.ocr_cache_table,
     env=env
 )
 
@@ -37,8 +38,8 @@ lambda_stack = LambdaStack(
 api_stack = ApiGatewayStack(
     app, 
     "DrugVerificationApiStack",
-    image_processor=lambda_stack.image_processor,
-    nafdac_validator=lambda_stack.nafdac_validator,
+    image_processor=lambda_stack.image_processor_alias,
+    nafdac_validator=lambda_stack.nafdac_validator_alias,
     verification_workflow=lambda_stack.verification_workflow,
     env=env
 )
@@ -1,31 +1,83 @@
 import json
 import base64
 import boto3
+import hashlib
+import io
+import logging
+import orjson
 import os
 import re
-from datetime import datetime
-import uuid
-from aws_lambda_powertools import Logger
-from aws_lambda_powertools.utilities.typing import LambdaContext
+import time
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+from PIL import Image, ImageOps
+from verification_ids import (
+    image_key, is_valid_timestamp, is_valid_verification_id, new_timestamp, new_verification_id
+)
 
-logger = Logger()
+if TYPE_CHECKING:
+    from aws_lambda_powertools.utilities.typing import LambdaContext
 
-s3_client = boto3.client('s3')
+# stdlib logging keeps Powertools out of this function's cold start
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+s3_client = boto3.client('s3', config=Config(
+    max_pool_connections=50,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    tcp_keepalive=True
+))
 textract_client = boto3.client('textract')
 bedrock_client = boto3.client('bedrock-runtime')
+dynamodb_client = boto3.client('dynamodb')
 
 IMAGE_BUCKET = os.environ['IMAGE_BUCKET_NAME']
+OCR_CACHE_TABLE = os.environ['OCR_CACHE_TABLE_NAME']
+OCR_CACHE_TTL_SECONDS = 24 * 60 * 60  # 1 day
+# Textract and Claude read labels just as well at this size; larger photos only add bytes and input tokens
+MAX_OCR_IMAGE_DIMENSION = 1024
+# Start Textract alongside Bedrock instead of only after it finds nothing (lower fallback latency, higher cost)
+SPECULATIVE_TEXTRACT = os.environ.get('SPECULATIVE_TEXTRACT', 'false').lower() == 'true'
+
+# Runs the S3 upload (and speculative Textract) alongside Bedrock; reused across warm invocations
+executor = ThreadPoolExecutor(max_workers=3)
+
+# NAFDAC format: [Letter][1-2 digits]-[4-6 digits] OR [2 digits]-[4-6 digits]
+# Examples: A4-1650, B4-1650, 04-1650, A4-100074
+# Both forms share one alternation so each line is scanned in a single pass
+NAFDAC_PATTERN = re.compile(r'\b(?:[A-Z]\d{1,2}|\d{2})\s*-\s*\d{4,6}\b', re.IGNORECASE)
+# Normalize: Remove spaces around hyphen "B4 - 1650" -> "B4-1650"
+HYPHEN_NORMALIZE = re.compile(r'\s*-\s*')
+
+
+def _prime() -> None:
+    """Resolve lazily-built client internals during INIT so the first request doesn't pay for them"""
+    _ = s3_client.meta.events
+    _ = textract_client.meta.events
+    _ = bedrock_client.meta.service_model
+    orjson.dumps({})
+    base64.b64decode(b'AA==')
+    NAFDAC_PATTERN.search('A4-1650')
+
+
+# Prime before the SnapStart snapshot is taken, or when pre-initialized for provisioned concurrency
+if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') in ('snap-start', 'provisioned-concurrency'):
+    _prime()
 
 
 def store_image_in_s3(image_data: bytes, verification_id: str, timestamp: str) -> str:
     """Store image in S3 and return the key"""
-    filename = f"{timestamp}_{verification_id}.jpg"
-    s3_key = f"images/{filename}"
+    s3_key = image_key(verification_id, timestamp)
+    
+    # Precomputed digest lets S3 verify the upload without re-hashing the body on retries
+    content_md5 = base64.b64encode(hashlib.md5(image_data).digest()).decode('ascii')
     
     s3_client.put_object(
         Bucket=IMAGE_BUCKET,
         Key=s3_key,
         Body=image_data,
+        ContentMD5=content_md5,
         ContentType='image/jpeg'
     )
     
@@ -33,75 +85,149 @@ def store_image_in_s3(image_data: bytes, verification_id: str, timestamp: str) -
     return s3_key
 
 
-def extract_product_name_with_bedrock(image_data: bytes, ocr_text: str = None) -> str:
-    """Use AWS Bedrock (Claude) to extract product name from image with OCR context"""
+def downscale_image(image_data: bytes) -> bytes:
+    """Shrink large photos to MAX_OCR_IMAGE_DIMENSION px JPEG for OCR, returning small images unchanged"""
     try:
-        logger.info("Using Bedrock to extract product name")
+        image = Image.open(io.BytesIO(image_data))
+        if max(image.size) <= MAX_OCR_IMAGE_DIMENSION:
+            return image_data
+        
+        # thumbnail() uses JPEG draft mode to decode at reduced scale before resampling
+        image.thumbnail((MAX_OCR_IMAGE_DIMENSION, MAX_OCR_IMAGE_DIMENSION), Image.LANCZOS)
+        image = ImageOps.exif_transpose(image).convert('RGB')
         
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        buf = io.BytesIO()
+        image.save(buf, 'JPEG', quality=85, optimize=True)
+        logger.info(f"Downscaled image for OCR: {len(image_data)} -> {buf.tell()} bytes")
+        return buf.getvalue()
         
-        # Build prompt with OCR context if available
-        if ocr_text:
-            prompt = f"""Here is the OCR text extracted from this pharmaceutical product image:
+    except Exception as e:
+        logger.error(f"Image downscale failed, using original: {str(e)}")
+        return image_data
 
-{ocr_text}
 
-Based on the image and the OCR text above, extract ONLY the main drug/product name. 
-Return just the product name, nothing else (no dosage, no manufacturer, no extra words).
-Ensure correct spelling by cross-referencing the image and text.
-Example: If you see "Lisinopril 10mg Tablets", return only "Lisinopril"."""
-        else:
-            prompt = "Extract only the main drug/product name from this pharmaceutical product. Return just the name, nothing else (no dosage, no manufacturer). Ensure correct spelling."
+def get_cached_ocr_result(image_hash: str) -> dict:
+    """Return the OCR result previously stored for this image hash, or None"""
+    try:
+        response = dynamodb_client.get_item(
+            TableName=OCR_CACHE_TABLE,
+            Key={'sha': {'S': image_hash}}
+        )
+    except Exception as e:
+        logger.error(f"OCR cache lookup failed: {str(e)}")
+        return None
+    
+    item = response.get('Item')
+    # DynamoDB deletes expired items lazily, so check the TTL ourselves
+    if not item or int(item['ttl']['N']) <= time.time():
+        return None
+    
+    logger.info(f"OCR cache hit: {image_hash}")
+    return orjson.loads(item['result']['S'])
+
+
+def cache_ocr_result(image_hash: str, ocr_result: dict) -> None:
+    """Store an OCR result keyed by image hash so identical uploads skip Bedrock and Textract"""
+    try:
+        dynamodb_client.put_item(
+            TableName=OCR_CACHE_TABLE,
+            Item={
+                'sha': {'S': image_hash},
+                'result': {'S': orjson.dumps(ocr_result).decode()},
+                'ttl': {'N': str(int(time.time()) + OCR_CACHE_TTL_SECONDS)}
+            }
+        )
+    except Exception as e:
+        logger.error(f"OCR cache write failed: {str(e)}")
+
+
+def extract_label_with_bedrock(image_base64: str) -> dict:
+    """Use AWS Bedrock (Claude) to read the NAFDAC number and product name in a single pass"""
+    try:
+        logger.info("Using Bedrock to extract NAFDAC number and product name")
+        
+        prompt = """Read this pharmaceutical product image and return a JSON object with two fields:
+- "nafdac": the NAFDAC registration number, or null if none is visible. It is a letter followed by 1-2 digits, or just 2 digits, then a hyphen and 4-6 digits (e.g. A4-1650, 04-1650, A4-100074).
+- "product": ONLY the main drug/product name (no dosage, no manufacturer, no extra words), or null if it cannot be read. Ensure correct spelling.
+Example: {"nafdac": "A4-1650", "product": "Lisinopril"}
+Return only the JSON object."""
         
         request_body = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 30,
-            "messages": [{
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg",
-                            "data": image_base64
+            "max_tokens": 48,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/jpeg",
+                                "data": image_base64
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": prompt
                         }
-                    },
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
-            }]
+                    ]
+                },
+                # Prefill the opening brace so Claude answers with bare JSON
+                {
+                    "role": "assistant",
+                    "content": "{"
+                }
+            ]
         }
         
-        response = bedrock_client.invoke_model(
+        response = bedrock_client.invoke_model_with_response_stream(
             modelId="anthropic.claude-3-haiku-20240307-v1:0",
-            body=json.dumps(request_body)
+            body=orjson.dumps(request_body)
         )
         
-        response_body = json.loads(response['body'].read())
-        product_name = response_body['content'][0]['text'].strip().strip('"\'').split('\n')[0]
+        # Stream the answer and stop reading as soon as the JSON object is closed
+        buf = ['{']
+        stream = response['body']
+        for event in stream:
+            chunk = orjson.loads(event['chunk']['bytes'])
+            if chunk['type'] == 'content_block_delta':
+                text = chunk['delta'].get('text', '')
+                buf.append(text)
+                if '}' in text:
+                    break
+        stream.close()
         
-        logger.info(f"Extracted product name: {product_name}")
-        return product_name if product_name else None
+        label, _ = json.JSONDecoder().raw_decode(''.join(buf))
+        
+        # Only trust a NAFDAC number that matches the expected format
+        match = NAFDAC_PATTERN.search(str(label.get('nafdac') or ''))
+        nafdac_number = HYPHEN_NORMALIZE.sub('-', match.group(0).strip().upper()) if match else None
+        
+        product_name = str(label.get('product') or '').strip().strip('"\'') or None
+        
+        logger.info(f"Bedrock extracted NAFDAC: {nafdac_number}, product name: {product_name}")
+        return {'nafdacNumber': nafdac_number, 'productName': product_name}
         
     except Exception as e:
         logger.error(f"Bedrock extraction failed: {str(e)}")
-        return None
+        return {'nafdacNumber': None, 'productName': None}
 
 
-def extract_nafdac_number_ocr(s3_key: str, image_data: bytes = None) -> dict:
-    """Extract NAFDAC number from image using AWS Textract"""
+def extract_nafdac_number_textract(image_data: bytes) -> dict:
+    """Extract NAFDAC number from image bytes using AWS Textract"""
     try:
-        logger.info(f"Starting OCR extraction for {s3_key}")
+        logger.info(f"Starting OCR extraction ({len(image_data)} bytes)")
         
         response = textract_client.detect_document_text(
-            Document={'S3Object': {'Bucket': IMAGE_BUCKET, 'Name': s3_key}}
+            Document={'Bytes': image_data}
         )
         
         all_text = []
-        nafdac_candidates = []
+        # Track the highest-confidence match as we go instead of collecting every candidate
+        best_num = None
+        best_conf = -1.0
+        match_count = 0
         
         for block in response.get('Blocks', []):
             if block['BlockType'] == 'LINE':
@@ -109,44 +235,33 @@ def extract_nafdac_number_ocr(s3_key: str, image_data: bytes = None) -> dict:
                 confidence = block.get('Confidence', 0)
                 all_text.append(text)
                 
-                # NAFDAC format: [Letter][1-2 digits]-[4-6 digits] OR [2 digits]-[4-6 digits]
-                # Examples: A4-1650, B4-1650, 04-1650, A4-100074
-                nafdac_patterns = [
-                    r'\b[A-Z]\d{1,2}\s*-\s*\d{4,6}\b',  # Matches A4-1650, B4 - 1650, etc.
-                    r'\b\d{2}\s*-\s*\d{4,6}\b',  # Matches 04-1650, 01 - 1234, etc.
-                ]
-                
-                for pattern in nafdac_patterns:
-                    for match in re.finditer(pattern, text, re.IGNORECASE):
-                        nafdac_num = match.group(0).strip().upper()
-                        # Normalize: Remove spaces around hyphen "B4 - 1650" -> "B4-1650"
-                        nafdac_num = re.sub(r'\s*-\s*', '-', nafdac_num)
-                        
-                        nafdac_candidates.append({'number': nafdac_num, 'confidence': confidence})
+                for match in NAFDAC_PATTERN.finditer(text):
+                    nafdac_num = HYPHEN_NORMALIZE.sub('-', match.group(0).strip().upper())
+                    
+                    if confidence > best_conf:
+                        best_num, best_conf = nafdac_num, confidence
+                    match_count += 1
+                    if match_count <= 3:
                         logger.info(f"Found NAFDAC: {nafdac_num} ({confidence}%)")
         
         full_text = ' '.join(all_text)
         logger.info(f"Extracted text: {full_text[:200]}...")
         
-        if nafdac_candidates:
-            best = max(nafdac_candidates, key=lambda x: x['confidence'])
-            logger.info(f"Selected NAFDAC: {best['number']} ({best['confidence']}%)")
+        if best_num:
+            logger.info(f"Selected NAFDAC: {best_num} ({best_conf}%)")
             return {
-                'nafdacNumber': best['number'],
-                'confidence': best['confidence'],
+                'nafdacNumber': best_num,
+                'confidence': best_conf,
                 'allText': full_text,
                 'productName': None
             }
         
-        # No NAFDAC found - use Bedrock for product name
-        logger.warning("No NAFDAC found, using Bedrock with OCR context")
-        product_name = extract_product_name_with_bedrock(image_data, full_text) if image_data else None
-        
+        logger.warning("No NAFDAC found in OCR text")
         return {
             'nafdacNumber': None,
             'confidence': None,
             'allText': full_text,
-            'productName': product_name
+            'productName': None
         }
             
     except Exception as e:
@@ -154,8 +269,31 @@ def extract_nafdac_number_ocr(s3_key: str, image_data: bytes = None) -> dict:
         return {'nafdacNumber': None, 'confidence': None, 'allText': '', 'productName': None}
 
 
-@logger.inject_lambda_context
-def handler(event: dict, context: LambdaContext) -> dict:
+def extract_nafdac_number_ocr(image_data: bytes, image_base64: str) -> dict:
+    """Extract NAFDAC number or product name, reading the image with Bedrock first and Textract as fallback"""
+    textract_result = executor.submit(extract_nafdac_number_textract, image_data) if SPECULATIVE_TEXTRACT else None
+    
+    label = extract_label_with_bedrock(image_base64)
+    
+    if label['nafdacNumber'] or label['productName']:
+        if textract_result:
+            # Not needed, but must finish before the environment is frozen after this invocation
+            textract_result.result()
+        return {
+            'nafdacNumber': label['nafdacNumber'],
+            'confidence': None,
+            'allText': None,
+            'productName': label['productName']
+        }
+    
+    # Bedrock could not read the label - fall back to Textract for the NAFDAC number
+    logger.warning("Bedrock found no NAFDAC number or product name, falling back to Textract")
+    if textract_result:
+        return textract_result.result()
+    return extract_nafdac_number_textract(image_data)
+
+
+def handler(event: dict, context: 'LambdaContext') -> dict:
     """
     Image Processing Lambda Handler
     
@@ -164,54 +302,92 @@ def handler(event: dict, context: LambdaContext) -> dict:
     Input:
     {
         "image": "base64_encoded_image_data",
-        "nafdacNumber": "optional_manual_nafdac_number"
+        "nafdacNumber": "optional_manual_nafdac_number",
+        "storeImage": false,
+        "verificationId": "optional_preassigned_id",
+        "timestamp": "optional_preassigned_ISO8601_timestamp"
     }
     
+    The image is only required (and stored) when no nafdacNumber is given or storeImage is true.
+    verificationId and timestamp are only accepted on direct invocation; requests through
+    API Gateway always get generated values. Direct callers (the verification workflow) must
+    never forward these fields from their own callers, since they decide the S3 key.
+    
     Output:
     {
-        "verificationId": "uuid",
+        "verificationId": "base32_id",
         "timestamp": "ISO8601_timestamp",
-        "imageKey": "s3_key",
+        "imageKey": "s3_key_or_null",
         "nafdacNumber": "extracted_or_manual_number"
     }
     """
     try:
         # Parse request body
         if 'body' in event:
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+            body = orjson.loads(event['body']) if isinstance(event['body'], str) else event['body']
         else:
             body = event
         
-        # Generate verification ID and timestamp
-        verification_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow().isoformat()
-        
-        # Decode base64 image
-        image_base64 = body.get('image', '')
-        if not image_base64:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Missing image data'})
-            }
-        
-        # Remove data URL prefix if present
-        if ',' in image_base64:
-            image_base64 = image_base64.split(',')[1]
+        # The workflow assigns the verification ID and timestamp when it validates in parallel. They
+        # decide the S3 key, so only honour them on direct invocation, never from API Gateway.
+        verification_id = new_verification_id()
+        timestamp = new_timestamp()
+        if 'body' not in event and (body.get('verificationId') or body.get('timestamp')):
+            if not is_valid_verification_id(body.get('verificationId')) or not is_valid_timestamp(body.get('timestamp')):
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': 'Invalid verificationId or timestamp'})
+                }
+            verification_id = body['verificationId']
+            timestamp = body['timestamp']
         
-        image_data = base64.b64decode(image_base64)
-        
-        # Store image in S3
-        s3_key = store_image_in_s3(image_data, verification_id, timestamp)
-        
-        # Extract NAFDAC number or product name
-        ocr_result = extract_nafdac_number_ocr(s3_key, image_data) if not body.get('nafdacNumber') else {
-            'nafdacNumber': body.get('nafdacNumber'),
+        manual_nafdac = body.get('nafdacNumber')
+        ocr_result = {
+            'nafdacNumber': manual_nafdac,
             'confidence': None,
             'allText': None,
             'productName': None
         }
+        s3_key = None
+        
+        # A manual NAFDAC number needs no OCR, so only decode the image if it must be stored
+        if not manual_nafdac or body.get('storeImage', False):
+            # Decode base64 image
+            if not body.get('image'):
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': 'Missing image data'})
+                }
+            
+            # Work on bytes and skip the data URL prefix if present
+            raw = body['image'].encode('ascii')
+            comma = raw.find(b',')
+            payload = raw[comma + 1:] if comma != -1 else raw
+            image_data = base64.b64decode(payload, validate=False)
+            del raw, payload
+            
+            # Store image in S3 while OCR runs; Textract reads the bytes directly
+            upload = executor.submit(store_image_in_s3, image_data, verification_id, timestamp)
+            
+            # Extract NAFDAC number or product name
+            if not manual_nafdac:
+                # Identical uploads (retries, resubmissions) reuse the earlier result
+                image_hash = hashlib.sha256(image_data).hexdigest()
+                cached_result = get_cached_ocr_result(image_hash)
+                if cached_result:
+                    ocr_result = cached_result
+                else:
+                    # OCR works on a downscaled copy; the original is what gets stored in S3
+                    ocr_image = downscale_image(image_data)
+                    # Canonical base64 is encoded once here and reused for the Bedrock request
+                    ocr_result = extract_nafdac_number_ocr(ocr_image, base64.b64encode(ocr_image).decode('ascii'))
+                    # Only cache useful results so transient Bedrock/Textract failures are retried
+                    if ocr_result['nafdacNumber'] or ocr_result['productName']:
+                        cache_ocr_result(image_hash, ocr_result)
+            
+            s3_key = upload.result()
         
-        logger.info(f"Processed: ID={verification_id}, NAFDAC={ocr_result.get('nafdacNumber')}, Product={ocr_result.get('productName')}")
+        logger.info(f"Processed: RequestId={context.aws_request_id}, ID={verification_id}, NAFDAC={ocr_result.get('nafdacNumber')}, Product={ocr_result.get('productName')}")
         
         response = {
             'verificationId': verification_id,
@@ -229,10 +405,12 @@ def handler(event: dict, context: LambdaContext) -> dict:
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps(response)
+            'body': orjson.dumps(response).decode()
         }
         
-        logger.info(f"Returning response: {json.dumps(result)}")
+        logger.info(f"Returning response: status={result['statusCode']}, ID={verification_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Response body: {result['body']}")
         return result
         
     except Exception as e:
@@ -1,23 +1,138 @@
-import json
+import atexit
 import boto3
+import orjson
 import os
 import time
-from datetime import datetime
+from botocore.config import Config
+from botocore.exceptions import WaiterError
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
 logger = Logger()
 
-dynamodb = boto3.resource('dynamodb')
+# Low-level client: no resource-layer marshalling on the write path
+ddb = boto3.client('dynamodb', config=Config(
+    max_pool_connections=16,
+    retries={'mode': 'standard', 'max_attempts': 2},
+    tcp_keepalive=True
+))
 VERIFICATION_TABLE = os.environ['VERIFICATION_TABLE_NAME']
-table = dynamodb.Table(VERIFICATION_TABLE)
+s3_client = boto3.client('s3')
+IMAGE_BUCKET = os.environ['IMAGE_BUCKET_NAME']
+# How long to wait for an image the workflow is uploading in parallel before dropping the reference
+IMAGE_UPLOAD_WAIT_SECONDS = 10
+# Set by the container image (see Dockerfile)
+CHROME_BIN = os.environ.get('CHROME_BIN', '/opt/chrome-linux64/chrome')
+CHROMEDRIVER_BIN = os.environ.get('CHROMEDRIVER_BIN', '/opt/chromedriver-linux64/chromedriver')
+# Reuse a successful Greenbook lookup for the same NAFDAC number within this window
+VALIDATION_CACHE_SECONDS = 24 * 60 * 60  # 1 day
+
+RESULT_ROWS_SELECTOR = 'table.data-table tbody tr'
+# Whether any result row mentions the search term (arguments[0])
+ROWS_CONTAIN_SCRIPT = """
+const term = arguments[0].toUpperCase();
+return Array.from(document.querySelectorAll('table.data-table tbody tr'))
+    .some(r => r.innerText.toUpperCase().includes(term));
+"""
+# Greenbook result rows with at least 10 cells, as plain dicts
+EXTRACT_ROWS_SCRIPT = """
+return Array.from(document.querySelectorAll('table.data-table tbody tr'))
+    .map(r => r.querySelectorAll('td'))
+    .filter(c => c.length >= 10)
+    .map(c => ({
+        product_name: c[0].innerText.trim(),
+        active_ingredients: c[1].innerText.trim(),
+        product_category: c[2].innerText.trim(),
+        nrn: c[3].innerText.trim(),
+        status: c[9].innerText.trim()
+    }));
+"""
+
+def _build_options() -> Options:
+    """Build the Chrome options used for every driver in this container"""
+    chrome_options = Options()
+    chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--disable-dev-tools')
+    chrome_options.add_argument('--no-zygote')
+    chrome_options.add_argument('--single-process')
+    chrome_options.add_argument('--user-data-dir=/tmp/chrome-user-data')
+    chrome_options.add_argument('--data-path=/tmp/chrome-data')
+    chrome_options.add_argument('--disk-cache-dir=/tmp/chrome-cache')
+    chrome_options.add_argument('--remote-debugging-port=9222')
+    # Only the results table is read, so skip images, stylesheets and background work
+    chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument('--disable-background-networking')
+    chrome_options.add_argument('--disable-background-timer-throttling')
+    chrome_options.add_argument('--disable-default-apps')
+    chrome_options.add_argument('--disable-sync')
+    chrome_options.add_argument('--disable-translate')
+    chrome_options.add_argument('--mute-audio')
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.default_content_setting_values.notifications": 2
+    })
+    chrome_options.binary_location = CHROME_BIN
+    return chrome_options
+
+
+_CHROME_OPTIONS = _build_options()
+
+# Chrome is started once per container and reused across warm invocations
+_driver = None
+
+
+def get_driver() -> webdriver.Chrome:
+    """Return the shared Chrome driver, starting it on first use"""
+    global _driver
+    
+    if _driver is None:
+        logger.info("Starting Chrome")
+        # A fresh Service per start, since quitting a driver stops its chromedriver process
+        service = Service(executable_path=CHROMEDRIVER_BIN)
+        _driver = webdriver.Chrome(service=service, options=_CHROME_OPTIONS)
+    
+    return _driver
+
+
+def reset_driver() -> None:
+    """Quit the shared Chrome driver so the next call starts a fresh one"""
+    global _driver
+    
+    if _driver is not None:
+        try:
+            _driver.quit()
+        except Exception as e:
+            logger.warning(f"Error quitting Chrome: {str(e)}")
+        _driver = None
+
+
+atexit.register(reset_driver)
+
+
+def _prime() -> None:
+    """Start Chrome during INIT so the first request on this environment doesn't wait for it"""
+    try:
+        get_driver()
+    except Exception as e:
+        # The first request will retry the launch
+        logger.warning(f"Could not start Chrome during init: {str(e)}")
+
+
+# Provisioned environments are initialized ahead of traffic, so launch the browser then
+if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency':
+    _prime()
 
 
 def scrape_nafdac_greenbook(nafdac_number: str = None, product_name: str = None) -> dict:
@@ -48,26 +163,15 @@ def scrape_nafdac_greenbook(nafdac_number: str = None, product_name: str = None)
         if search_term != product_name:
             logger.info(f"Using first word from '{product_name}' → searching for '{search_term}'")
     
+    if nafdac_number:
+        cached_result = get_cached_validation(nafdac_number)
+        if cached_result:
+            return cached_result
+    
     logger.info(f"Starting NAFDAC Greenbook scraping for {search_type}: {search_term}")
     
     try:
-        # Setup Chrome options for Lambda
-        chrome_options = Options()
-        chrome_options.add_argument('--headless=new')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--disable-dev-tools')
-        chrome_options.add_argument('--no-zygote')
-        chrome_options.add_argument('--single-process')
-        chrome_options.add_argument('--user-data-dir=/tmp/chrome-user-data')
-        chrome_options.add_argument('--data-path=/tmp/chrome-data')
-        chrome_options.add_argument('--disk-cache-dir=/tmp/chrome-cache')
-        chrome_options.add_argument('--remote-debugging-port=9222')
-        
-        chrome_options.binary_location = '/opt/chrome-linux64/chrome'
-        service = Service(executable_path='/opt/chromedriver-linux64/chromedriver')
-        driver = webdriver.Chrome(service=service, options=chrome_options)
+        driver = get_driver()
         
         try:
             logger.info("Navigating to NAFDAC Greenbook...")
@@ -79,57 +183,50 @@ def scrape_nafdac_greenbook(nafdac_number: str = None, product_name: str = None)
                 EC.presence_of_element_located((By.ID, search_field_id))
             )
             
+            # Rows already in the table before searching must not be mistaken for the results
+            pre_search_rows = driver.find_elements(By.CSS_SELECTOR, RESULT_ROWS_SELECTOR)
+            first_pre_search_row = pre_search_rows[0] if pre_search_rows else None
+            term_shown_before = bool(pre_search_rows) and driver.execute_script(ROWS_CONTAIN_SCRIPT, search_term)
+            
             logger.info(f"Entering {search_type}: {search_term}")
             search_input.clear()
             search_input.send_keys(search_term)
             
             logger.info("Waiting for results...")
-            time.sleep(4)  # Give time for AJAX
+            # Done once the table has been redrawn with rows, or a row shows the search term
+            def results_updated(d):
+                if not term_shown_before and d.execute_script(ROWS_CONTAIN_SCRIPT, search_term):
+                    return True
+                if first_pre_search_row is not None and not EC.staleness_of(first_pre_search_row)(d):
+                    return False
+                return len(d.find_elements(By.CSS_SELECTOR, RESULT_ROWS_SELECTOR)) > 0
             
             try:
-                wait.until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'table.data-table tbody tr'))
-                )
+                wait.until(results_updated)
+                table_updated = True
             except TimeoutException:
-                logger.warning("No results found")
-                driver.quit()
-                return {
-                    "success": True,
-                    "searchTerm": search_term,
-                    "searchType": search_type,
-                    "nafdacNumber": nafdac_number,
-                    "found": False,
-                    "message": f"Product not found in NAFDAC Greenbook (searched by {search_type})"
-                }
+                # The table may have been updated in place; read whatever rows are there
+                # and let the filters below decide, rather than reporting not-found outright
+                logger.warning("Results table did not visibly change, reading the current rows")
+                table_updated = False
             
             logger.info("Extracting product data...")
-            rows = driver.find_elements(By.CSS_SELECTOR, 'table.data-table tbody tr')
+            # Read every row in one WebDriver call instead of one call per cell
+            rows = driver.execute_script(EXTRACT_ROWS_SCRIPT)
             
             results = []
-            for row in rows:
-                cells = row.find_elements(By.TAG_NAME, 'td')
-                if len(cells) >= 10:
-                    result = {
-                        'product_name': cells[0].text.strip(),
-                        'active_ingredients': cells[1].text.strip(),
-                        'product_category': cells[2].text.strip(),
-                        'nrn': cells[3].text.strip(),
-                        'status': cells[9].text.strip(),
-                    }
-                    
-                    # Filter: if searching by NAFDAC number, only include exact matches
-                    if nafdac_number:
-                        if result['nrn'].upper() == nafdac_number.upper():
-                            results.append(result)
-                            logger.info(f"Exact match found: {result['product_name']} (NRN: {result['nrn']})")
-                        else:
-                            logger.info(f"Skipping non-match: {result['nrn']} != {nafdac_number}")
-                    else:
-                        # For product name search, include all results
+            for result in rows:
+                # Filter: if searching by NAFDAC number, only include exact matches
+                if nafdac_number:
+                    if result['nrn'].upper() == nafdac_number.upper():
                         results.append(result)
-                        logger.info(f"Found product by name: {result['product_name']}")
-            
-            driver.quit()
+                        logger.info(f"Exact match found: {result['product_name']} (NRN: {result['nrn']})")
+                    else:
+                        logger.info(f"Skipping non-match: {result['nrn']} != {nafdac_number}")
+                elif table_updated or search_term.upper() in result['product_name'].upper():
+                    # For product name search, include all results (only matching names if the rows may predate the search)
+                    results.append(result)
+                    logger.info(f"Found product by name: {result['product_name']}")
             
             if results:
                 return {
@@ -138,7 +235,9 @@ def scrape_nafdac_greenbook(nafdac_number: str = None, product_name: str = None)
                     "searchType": search_type,
                     "nafdacNumber": nafdac_number,
                     "found": True,
-                    "results": results
+                    "results": results,
+                    # Server-side scrape time; cached copies keep it so they can't refresh the cache
+                    "validatedAt": int(time.time())
                 }
             else:
                 return {
@@ -150,10 +249,32 @@ def scrape_nafdac_greenbook(nafdac_number: str = None, product_name: str = None)
                     "message": f"Product not found in NAFDAC Greenbook (searched by {search_type})"
                 }
                 
-        except Exception as e:
-            driver.quit()
-            raise e
+        finally:
+            # Leave the shared browser clean for the next invocation
+            try:
+                driver.delete_all_cookies()
+                driver.get('about:blank')
+            except WebDriverException as e:
+                logger.warning(f"Error resetting Chrome state: {str(e)}")
+                reset_driver()
             
+    except TimeoutException as e:
+        # Greenbook is slow, but the browser is fine - keep it warm for the next call
+        logger.error(f"Timed out scraping NAFDAC Greenbook: {str(e)}")
+        return {
+            "success": False,
+            "error": f"Failed to validate: {str(e)}",
+            "message": "NAFDAC Greenbook is taking too long to respond. Please try again later."
+        }
+    except WebDriverException as e:
+        # The browser may be dead or wedged - rebuild it on the next call
+        logger.error(f"Chrome error scraping NAFDAC Greenbook: {str(e)}")
+        reset_driver()
+        return {
+            "success": False,
+            "error": f"Failed to validate: {str(e)}",
+            "message": "Unable to connect to NAFDAC Greenbook. Please try again later."
+        }
     except Exception as e:
         logger.error(f"Error scraping NAFDAC Greenbook: {str(e)}")
         return {
@@ -163,22 +284,110 @@ def scrape_nafdac_greenbook(nafdac_number: str = None, product_name: str = None)
         }
 
 
+def to_attribute_value(value) -> dict:
+    """Convert a Python value to a typed DynamoDB attribute value"""
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float)):
+        return {'N': str(value)}
+    if isinstance(value, dict):
+        return {'M': {k: to_attribute_value(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'L': [to_attribute_value(v) for v in value]}
+    return {'S': str(value)}
+
+
+def from_attribute_value(value: dict):
+    """Convert a typed DynamoDB attribute value back to a Python value"""
+    (type_tag, data), = value.items()
+    if type_tag == 'NULL':
+        return None
+    if type_tag == 'N':
+        return float(data) if '.' in data else int(data)
+    if type_tag == 'M':
+        return {k: from_attribute_value(v) for k, v in data.items()}
+    if type_tag == 'L':
+        return [from_attribute_value(v) for v in data]
+    return data
+
+
+def get_cached_validation(nafdac_number: str) -> dict:
+    """Return a Greenbook match for this NAFDAC number scraped within the cache window, or None"""
+    cutoff = int(time.time()) - VALIDATION_CACHE_SECONDS
+    try:
+        # The record timestamp comes from the caller, so it only narrows the read;
+        # freshness is decided by the server-side validatedAt
+        response = ddb.query(
+            TableName=VERIFICATION_TABLE,
+            IndexName='NafdacNumberIndex',
+            KeyConditionExpression='nafdacNumber = :nafdac AND #ts >= :cutoff_ts',
+            FilterExpression='validationResult.found = :found AND validationResult.validatedAt >= :cutoff',
+            ExpressionAttributeNames={'#ts': 'timestamp'},
+            ExpressionAttributeValues={
+                ':nafdac': {'S': nafdac_number},
+                ':cutoff_ts': {'S': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(cutoff))},
+                ':found': {'BOOL': True},
+                ':cutoff': {'N': str(cutoff)}
+            }
+        )
+    except Exception as e:
+        logger.error(f"Validation cache lookup failed: {str(e)}")
+        return None
+    
+    items = response.get('Items', [])
+    if not items:
+        return None
+    
+    validation_result = max(
+        (from_attribute_value(item['validationResult']) for item in items),
+        key=lambda result: result['validatedAt']
+    )
+    logger.info(f"Using cached validation for {nafdac_number} from {validation_result['validatedAt']}")
+    return validation_result
+
+
+def image_is_stored(image_key: str) -> bool:
+    """Wait briefly for an image that may still be uploading; True once it exists in S3"""
+    try:
+        s3_client.get_waiter('object_exists').wait(
+            Bucket=IMAGE_BUCKET,
+            Key=image_key,
+            WaiterConfig={'Delay': 1, 'MaxAttempts': IMAGE_UPLOAD_WAIT_SECONDS}
+        )
+    except WaiterError as e:
+        logger.warning(f"Image {image_key} not found in S3: {str(e)}")
+        return False
+    return True
+
+
 def store_verification_result(verification_id: str, timestamp: str, image_key: str, 
                               nafdac_number: str, validation_result: dict) -> None:
-    """Store verification result in DynamoDB"""
+    """Store verification result in DynamoDB, skipping verification IDs that were already stored"""
     item = {
-        'verificationId': verification_id,
-        'timestamp': timestamp,
-        'imageKey': image_key,
-        'validationResult': validation_result,
-        'ttl': int(datetime.utcnow().timestamp()) + (90 * 24 * 60 * 60)  # 90 days TTL
+        'verificationId': {'S': verification_id},
+        'timestamp': {'S': timestamp},
+        'imageKey': {'S': image_key} if image_key else {'NULL': True},
+        'validationResult': to_attribute_value(validation_result),
+        'ttl': {'N': str(int(time.time()) + (90 * 24 * 60 * 60))}  # 90 days TTL
     }
     
     # Only add nafdacNumber if it's not None (GSI requires non-null values)
     if nafdac_number:
-        item['nafdacNumber'] = nafdac_number
+        item['nafdacNumber'] = {'S': nafdac_number}
+    
+    try:
+        # Retries of the same verification shouldn't pay for another full write
+        ddb.put_item(
+            TableName=VERIFICATION_TABLE,
+            Item=item,
+            ConditionExpression='attribute_not_exists(verificationId)'
+        )
+    except ddb.exceptions.ConditionalCheckFailedException:
+        logger.info(f"Verification result already stored: {verification_id}")
+        return
     
-    table.put_item(Item=item)
     logger.info(f"Verification result stored: {verification_id}")
 
 
@@ -207,16 +416,16 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
     }
     """
     try:
-        logger.info(f"Received event: {json.dumps(event)}")
+        logger.info("Received event", extra={"event": event})
         logger.info(f"Lambda context: function_name={context.function_name}, memory={context.memory_limit_in_mb}MB, timeout={context.get_remaining_time_in_millis()}ms")
         
         # Parse request body
         if 'body' in event:
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+            body = orjson.loads(event['body']) if isinstance(event['body'], str) else event['body']
         else:
             body = event
         
-        logger.info(f"Parsed body: {json.dumps(body)}")
+        logger.info("Parsed body", extra={"body": body})
         
         verification_id = body.get('verificationId')
         timestamp = body.get('timestamp')
@@ -233,9 +442,9 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Missing required fields'})
+                'body': orjson.dumps({'error': 'Missing required fields'}).decode()
             }
-            logger.error(f"Returning error response: {json.dumps(error_result)}")
+            logger.error("Returning error response", extra={"response": error_result})
             return error_result
         
         # Validate NAFDAC number or search by product name
@@ -245,7 +454,7 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
                 nafdac_number=nafdac_number,
                 product_name=product_name
             )
-            logger.info(f"Validation result: {json.dumps(validation_result)}")
+            logger.info("Validation result", extra={"result": validation_result})
         else:
             validation_result = {
                 "success": False,
@@ -253,6 +462,10 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
             }
             logger.warning("No NAFDAC number or product name provided")
         
+        # The image is uploaded in parallel by the workflow; don't reference it if that failed
+        if image_key and not image_is_stored(image_key):
+            image_key = None
+        
         # Store result in DynamoDB
         logger.info(f"Storing result in DynamoDB for verification ID: {verification_id}")
         store_verification_result(
@@ -278,10 +491,10 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps(response)
+            'body': orjson.dumps(response).decode()
         }
         
-        logger.info(f"Returning response: {json.dumps(result)}")
+        logger.info("Returning response", extra={"response": result})
         return result
         
     except Exception as e:
@@ -292,7 +505,7 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({'error': str(e)})
+            'body': orjson.dumps({'error': str(e)}).decode()
         }
-        logger.error(f"Returning error response: {json.dumps(error_result)}")
+        logger.error("Returning error response", extra={"response": error_result})
         return error_result
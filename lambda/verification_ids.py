@@ -0,0 +1,36 @@
+import base64
+import os
+import re
+import time
+
+# Lowercase base32 of 128 random bits, without padding
+VERIFICATION_ID_PATTERN = re.compile(r'[a-z2-7]{26}')
+# ISO8601 UTC timestamp with microseconds, as produced by new_timestamp()
+TIMESTAMP_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}')
+
+
+def new_verification_id() -> str:
+    """Generate a verification ID from 128 random bits (base32)"""
+    return base64.b32encode(os.urandom(16)).decode('ascii').rstrip('=').lower()
+
+
+def new_timestamp() -> str:
+    """Return the current time as an ISO8601 UTC timestamp with microseconds"""
+    now_ns = time.time_ns()
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now_ns // 1_000_000_000)) + f'.{now_ns // 1000 % 1_000_000:06d}'
+
+
+def is_valid_verification_id(verification_id) -> bool:
+    """Check that a verification ID has the format new_verification_id() produces"""
+    return isinstance(verification_id, str) and VERIFICATION_ID_PATTERN.fullmatch(verification_id) is not None
+
+
+def is_valid_timestamp(timestamp) -> bool:
+    """Check that a timestamp has the format new_timestamp() produces"""
+    return isinstance(timestamp, str) and TIMESTAMP_PATTERN.fullmatch(timestamp) is not None
+
+
+
+def image_key(verification_id: str, timestamp: str) -> str:
+    """Return the S3 key the image for a verification is stored under"""
+    return f"images/{timestamp}_{verification_id}.jpg"
@@ -1,16 +1,93 @@
-import json
 import boto3
+import orjson
 import os
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from aws_lambda_powertools import Logger
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from verification_ids import image_key as build_image_key, new_timestamp, new_verification_id
 
 logger = Logger()
 
-lambda_client = boto3.client('lambda')
+# Keep the connection to the Lambda API alive between warm invocations. Invokes aren't idempotent (a retry
+# re-runs the Chrome scrape), so don't retry, and wait longer than the validator's 120s timeout.
+lambda_client = boto3.client('lambda', config=Config(
+    max_pool_connections=16,
+    read_timeout=130,
+    retries={'mode': 'standard', 'total_max_attempts': 1},
+    tcp_keepalive=True
+))
 
 IMAGE_PROCESSOR_ARN = os.environ['IMAGE_PROCESSOR_ARN']
 NAFDAC_VALIDATOR_ARN = os.environ['NAFDAC_VALIDATOR_ARN']
 
+# Runs the image processor and validator side by side; reused across warm invocations
+executor = ThreadPoolExecutor(max_workers=2)
+
+
+def invoke_image_processor(payload: dict) -> dict:
+    """Invoke the Image Processor Lambda and return its API response"""
+    image_processor_response = lambda_client.invoke(
+        FunctionName=IMAGE_PROCESSOR_ARN,
+        InvocationType='RequestResponse',
+        Payload=orjson.dumps(payload)
+    )
+    
+    image_result = orjson.loads(image_processor_response['Payload'].read())
+    logger.info("Image Processor response", extra={"response": image_result})
+    return image_result
+
+
+def invoke_validator(payload: dict) -> dict:
+    """Invoke the NAFDAC Validator Lambda and return its API response, or an error response"""
+    try:
+        validator_response = lambda_client.invoke(
+            FunctionName=NAFDAC_VALIDATOR_ARN,
+            InvocationType='RequestResponse',
+            Payload=orjson.dumps(payload)
+        )
+        
+        # Check for function errors
+        if 'FunctionError' in validator_response:
+            logger.error(f"NAFDAC Validator function error: {validator_response.get('FunctionError')}")
+            error_payload = orjson.loads(validator_response['Payload'].read())
+            logger.error("Error payload", extra={"payload": error_payload})
+            
+            # Return error response
+            error_result = {
+                'statusCode': 500,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                },
+                'body': orjson.dumps({
+                    'error': 'NAFDAC validation failed',
+                    'details': error_payload
+                }).decode()
+            }
+            logger.error("Returning error response", extra={"response": error_result})
+            return error_result
+        
+        validator_result = orjson.loads(validator_response['Payload'].read())
+        logger.info("NAFDAC Validator response", extra={"response": validator_result})
+        return validator_result
+        
+    except Exception as validator_error:
+        logger.exception(f"Error invoking NAFDAC Validator: {str(validator_error)}")
+        error_result = {
+            'statusCode': 500,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': orjson.dumps({
+                'error': 'Failed to invoke NAFDAC validator',
+                'details': str(validator_error)
+            }).decode()
+        }
+        logger.error("Returning error response", extra={"response": error_result})
+        return error_result
+
 
 @logger.inject_lambda_context
 def handler(event: dict, context: LambdaContext) -> dict:
@@ -20,15 +97,20 @@ def handler(event: dict, context: LambdaContext) -> dict:
     1. Calls Image Processor Lambda to store image and extract NAFDAC number
     2. Calls NAFDAC Validator Lambda to validate the number and store results
     
+    When a NAFDAC number is supplied the validator does not need the OCR result,
+    so both Lambdas are invoked in parallel, and the Image Processor is skipped
+    entirely unless the image is to be stored.
+    
     Input:
     {
         "image": "base64_encoded_image_data",
-        "nafdacNumber": "optional_manual_nafdac_number"
+        "nafdacNumber": "optional_manual_nafdac_number",
+        "storeImage": false
     }
     
     Output:
     {
-        "verificationId": "uuid",
+        "verificationId": "id",
         "timestamp": "ISO8601_timestamp",
         "imageKey": "s3_key",
         "nafdacNumber": "nafdac_number",
@@ -38,79 +120,68 @@ def handler(event: dict, context: LambdaContext) -> dict:
     try:
         # Parse request body
         if 'body' in event:
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+            body = orjson.loads(event['body']) if isinstance(event['body'], str) else event['body']
         else:
             body = event
         
+        if body.get('nafdacNumber'):
+            # Assign the verification ID, timestamp and image key here so both Lambdas agree on them
+            verification_id = new_verification_id()
+            timestamp = new_timestamp()
+            image_key = build_image_key(verification_id, timestamp) if body.get('storeImage') else None
+            
+            # Without storeImage the image processor has nothing to do for a manual number
+            image_future = None
+            if image_key:
+                logger.info(f"Invoking Image Processor and NAFDAC Validator in parallel for {body['nafdacNumber']}")
+                image_future = executor.submit(invoke_image_processor, {
+                    'image': body.get('image'),
+                    'nafdacNumber': body['nafdacNumber'],
+                    'storeImage': True,
+                    'verificationId': verification_id,
+                    'timestamp': timestamp
+                })
+            else:
+                logger.info(f"Invoking NAFDAC Validator Lambda for {body['nafdacNumber']}")
+            
+            # The validator only records imageKey once the object exists, so a failed upload isn't referenced
+            validator_future = executor.submit(invoke_validator, {
+                'verificationId': verification_id,
+                'timestamp': timestamp,
+                'imageKey': image_key,
+                'nafdacNumber': body['nafdacNumber']
+            })
+            
+            if image_future:
+                try:
+                    image_result = image_future.result()
+                    if image_result.get('statusCode') != 200:
+                        logger.warning("Image Processor failed", extra={"response": image_result})
+                except Exception as image_error:
+                    logger.exception(f"Error invoking Image Processor: {str(image_error)}")
+            
+            validator_result = validator_future.result()
+            logger.info("Returning final response", extra={"response": validator_result})
+            return validator_result
+        
         # Step 1: Process image
+        # Only forward the image: this is a direct invocation, so the image processor would
+        # otherwise accept a caller's verificationId/timestamp and with them the S3 key
         logger.info("Invoking Image Processor Lambda")
-        image_processor_response = lambda_client.invoke(
-            FunctionName=IMAGE_PROCESSOR_ARN,
-            InvocationType='RequestResponse',
-            Payload=json.dumps(body)
-        )
-        
-        image_result = json.loads(image_processor_response['Payload'].read())
-        logger.info(f"Image Processor response: {json.dumps(image_result)}")
+        image_result = invoke_image_processor({'image': body.get('image')})
         
         if image_result.get('statusCode') != 200:
-            logger.warning(f"Image Processor failed, returning error: {json.dumps(image_result)}")
+            logger.warning("Image Processor failed, returning error", extra={"response": image_result})
             return image_result
         
-        image_data = json.loads(image_result['body'])
+        image_data = orjson.loads(image_result['body'])
         
         # Step 2: Validate NAFDAC number
         logger.info(f"Invoking NAFDAC Validator Lambda for {image_data.get('nafdacNumber')}")
+        validator_result = invoke_validator(image_data)
+        logger.info("Returning final response", extra={"response": validator_result})
         
-        try:
-            validator_response = lambda_client.invoke(
-                FunctionName=NAFDAC_VALIDATOR_ARN,
-                InvocationType='RequestResponse',
-                Payload=json.dumps(image_data)
-            )
-            
-            # Check for function errors
-            if 'FunctionError' in validator_response:
-                logger.error(f"NAFDAC Validator function error: {validator_response.get('FunctionError')}")
-                error_payload = json.loads(validator_response['Payload'].read())
-                logger.error(f"Error payload: {json.dumps(error_payload)}")
-                
-                # Return error response
-                error_result = {
-                    'statusCode': 500,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'error': 'NAFDAC validation failed',
-                        'details': error_payload
-                    })
-                }
-                logger.error(f"Returning error response: {json.dumps(error_result)}")
-                return error_result
-            
-            validator_result = json.loads(validator_response['Payload'].read())
-            logger.info(f"NAFDAC Validator response: {json.dumps(validator_result)}")
-            logger.info(f"Returning final response: {json.dumps(validator_result)}")
-            
-            return validator_result
-            
-        except Exception as validator_error:
-            logger.exception(f"Error invoking NAFDAC Validator: {str(validator_error)}")
-            error_result = {
-                'statusCode': 500,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'error': 'Failed to invoke NAFDAC validator',
-                    'details': str(validator_error)
-                })
-            }
-            logger.error(f"Returning error response: {json.dumps(error_result)}")
-            return error_result
+        return validator_result
         
     except Exception as e:
         logger.exception("Error in verification workflow")
@@ -120,7 +191,7 @@ def handler(event: dict, context: LambdaContext) -> dict:
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({'error': str(e)})
+            'body': orjson.dumps({'error': str(e)}).decode()
         }
-        logger.error(f"Returning error response: {json.dumps(error_result)}")
+        logger.error("Returning error response", extra={"response": error_result})
         return error_result
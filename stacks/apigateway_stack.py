@@ -1,6 +1,7 @@
 from aws_cdk import (
     Stack,
     CfnOutput,
+    Duration,
     aws_apigateway as apigateway,
     aws_lambda as _lambda
 )
@@ -25,12 +26,16 @@ class ApiGatewayStack(Stack):
             deploy_options=apigateway.StageOptions(
                 stage_name="prod",
                 tracing_enabled=True,
-                data_trace_enabled=True,
+                # Request/response bodies carry base64 images, so only log errors
+                data_trace_enabled=False,
+                logging_level=apigateway.MethodLoggingLevel.ERROR,
+                metrics_enabled=True,
             ),
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=apigateway.Cors.ALL_ORIGINS,
                 allow_methods=apigateway.Cors.ALL_METHODS,
-                allow_headers=["Content-Type", "Authorization"]
+                allow_headers=["Content-Type", "Authorization"],
+                max_age=Duration.hours(1)
             )
         )
 
@@ -34,4 +34,16 @@ class DynamoDBStack(Stack):
                 name="timestamp",
                 type=dynamodb.AttributeType.STRING
             )
+        )
+
+        # DynamoDB table caching OCR results by image SHA-256 (entries expire after a day)
+        self.ocr_cache_table = dynamodb.Table(
+            self, "OcrCacheTable",
+            partition_key=dynamodb.Attribute(
+                name="sha",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="ttl"
         )
\ No newline at end of file
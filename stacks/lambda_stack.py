@@ -19,18 +19,34 @@ class LambdaStack(Stack):
         construct_id: str,
         image_bucket: s3.Bucket,
         verification_table: dynamodb.Table,
+        ocr_cache_table: dynamodb.Table,
         **kwargs
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
-        # Lambda layer for shared dependencies (boto3, aws-lambda-powertools)
+        # Lambda layer for shared dependencies (aws-lambda-powertools, orjson, Pillow)
         layer = _lambda.LayerVersion(
             self, 'SharedLayer',
             code=_lambda.Code.from_asset('./layer/layer.zip'),
             compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+            compatible_architectures=[_lambda.Architecture.ARM_64],
             description="Shared dependencies for Lambda functions"
         )        
         
+        # The zip functions share the lambda/ directory with the validator container;
+        # keep container-only files and bytecode out of their deployment packages
+        zip_code = _lambda.Code.from_asset(
+            "lambda",
+            exclude=[
+                "__pycache__",
+                "*.pyc",
+                ".dockerignore",
+                "Dockerfile",
+                "requirements.txt",
+                "nafdac_validator_container.py"
+            ]
+        )
+        
 
         # ========================================
         # Image Processing & OCR Lambda
@@ -45,24 +61,34 @@ class LambdaStack(Stack):
             self, "ImageProcessorFunction",
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="image_processor.handler",
-            code=_lambda.Code.from_asset("lambda"),
+            code=zip_code,
             timeout=Duration.seconds(30),
-            memory_size=512,
+            memory_size=1769,  # One full vCPU for base64 decode, image resize and JSON work
             log_group=image_processor_log_group,
             architecture=_lambda.Architecture.ARM_64,
+            snap_start=_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS,
             description="Processes base64 images, stores in S3, and extracts NAFDAC number via OCR",
             environment={
                 "POWERTOOLS_SERVICE_NAME": "ImageProcessor",
                 "POWERTOOLS_METRICS_NAMESPACE": "DrugVerification",
                 "LOG_LEVEL": "INFO",
-                "IMAGE_BUCKET_NAME": image_bucket.bucket_name
+                "IMAGE_BUCKET_NAME": image_bucket.bucket_name,
+                "OCR_CACHE_TABLE_NAME": ocr_cache_table.table_name,
+                "SPECULATIVE_TEXTRACT": "false"
             },
             layers=[layer]
         )
         
+        # Published versions are SnapStart snapshots of the initialized module; callers use the "live" alias.
+        # SnapStart cannot be combined with provisioned concurrency, so the alias relies on snapshots alone.
+        self.image_processor_alias = self.image_processor.add_alias("live")
+        
         # Grant S3 permissions
         image_bucket.grant_read_write(self.image_processor)
         
+        # Grant OCR cache permissions
+        ocr_cache_table.grant_read_write_data(self.image_processor)
+        
         # Grant Textract permissions for OCR
         self.image_processor.add_to_role_policy(
             iam.PolicyStatement(
@@ -78,7 +104,8 @@ class LambdaStack(Stack):
         self.image_processor.add_to_role_policy(
             iam.PolicyStatement(
                 actions=[
-                    'bedrock:InvokeModel'
+                    'bedrock:InvokeModel',
+                    'bedrock:InvokeModelWithResponseStream'
                 ],
                 resources=[
                     f'arn:aws:bedrock:{self.region}::foundation-model/anthropic.claude-3-haiku-20240307-v1:0'
@@ -105,19 +132,24 @@ class LambdaStack(Stack):
             timeout=Duration.seconds(120),
             memory_size=2048,
             log_group=validator_log_group,
+            # Chrome for Testing only ships linux64 (x86_64) builds, so the Selenium container stays on x86
             architecture=_lambda.Architecture.X86_64,
             description="Validates NAFDAC numbers by scraping Greenbook using Selenium with Chrome",
             environment={
                 "POWERTOOLS_SERVICE_NAME": "NAFDACValidator",
                 "POWERTOOLS_METRICS_NAMESPACE": "DrugVerification",
                 "LOG_LEVEL": "INFO",
-                "CHROME_BIN": "/opt/chrome-linux64/chrome",
-                "CHROMEDRIVER_BIN": "/opt/chromedriver-linux64/chromedriver",
                 "VERIFICATION_TABLE_NAME": verification_table.table_name,
                 "IMAGE_BUCKET_NAME": image_bucket.bucket_name
             }
         )
         
+        # Keep pre-initialized containers behind the "live" alias so requests skip the image pull and init
+        self.nafdac_validator_alias = self.nafdac_validator.add_alias(
+            "live",
+            provisioned_concurrent_executions=2
+        )
+        
         # Grant permissions
         verification_table.grant_read_write_data(self.nafdac_validator)
         image_bucket.grant_read(self.nafdac_validator)
@@ -138,9 +170,9 @@ class LambdaStack(Stack):
             self, "WorkflowFunction",
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="verification_workflow.handler",
-            code=_lambda.Code.from_asset("lambda"),
+            code=zip_code,
             timeout=Duration.seconds(300),  # 5 minutes to allow for validator execution
-            memory_size=512,
+            memory_size=256,  # Only forwards payloads between functions
             log_group=workflow_log_group,
             architecture=_lambda.Architecture.ARM_64,
             description="Orchestrates the complete verification workflow",
@@ -148,15 +180,15 @@ class LambdaStack(Stack):
                 "POWERTOOLS_SERVICE_NAME": "VerificationWorkflow",
                 "POWERTOOLS_METRICS_NAMESPACE": "DrugVerification",
                 "LOG_LEVEL": "INFO",
-                "IMAGE_PROCESSOR_ARN": self.image_processor.function_arn,
-                "NAFDAC_VALIDATOR_ARN": self.nafdac_validator.function_arn
+                "IMAGE_PROCESSOR_ARN": self.image_processor_alias.function_arn,
+                "NAFDAC_VALIDATOR_ARN": self.nafdac_validator_alias.function_arn
             },
             layers=[layer]
         )
         
         # Grant permissions to invoke other Lambdas
-        self.image_processor.grant_invoke(self.verification_workflow)
-        self.nafdac_validator.grant_invoke(self.verification_workflow)
+        self.image_processor_alias.grant_invoke(self.verification_workflow)
+        self.nafdac_validator_alias.grant_invoke(self.verification_workflow)
         
         # Add CloudWatch Insights permissions
         self.verification_workflow.role.add_managed_policy(
@@ -25,6 +25,16 @@ class S3Stack(Stack):
             )],
             removal_policy=RemovalPolicy.RETAIN,
             versioned=True,
+            lifecycle_rules=[s3.LifecycleRule(
+                # Let S3 move rarely viewed images to cheaper access tiers
+                transitions=[s3.Transition(
+                    storage_class=s3.StorageClass.INTELLIGENT_TIERING,
+                    transition_after=Duration.days(0)
+                )],
+                expiration=Duration.days(180),
+                noncurrent_version_expiration=Duration.days(30),
+                abort_incomplete_multipart_upload_after=Duration.days(1)
+            )],
             block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
             encryption=s3.BucketEncryption.S3_MANAGED,
         )